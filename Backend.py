@@ -1,9 +1,14 @@
 import asyncio
 import websockets
-import json
-import uuid
+import os
+import orjson
 from datetime import datetime
-from typing import Dict, Set, Tuple, Optional
+from typing import Dict, List, Set, Tuple, Optional
+
+try:
+    import uvloop  # 可选：基于libuv的事件循环（Windows不支持）
+except ImportError:
+    uvloop = None
 
 # ==============================================
 # 核心配置与常量（与JS代码保持一致）
@@ -12,16 +17,26 @@ WS_SERVER_PORT = 8765  # 与JS代码相同的端口
 PUNISHMENT_DURATION = 5  # 默认发送时间（秒）
 PUNISHMENT_TIME = 1  # 每秒发送次数
 HEARTBEAT_INTERVAL = 60  # 心跳间隔（秒）
+SEND_QUEUE_SIZE = 1024  # 每个连接发送队列上限（条）
+WS_MAX_SIZE = 2 ** 16  # 单条消息最大字节数（协议消息均为短JSON）
+REQUIRED_FIELDS = frozenset(("type", "clientId", "targetId", "message"))  # 消息必填字段
+CLIENT_ID_BATCH = 256  # 每次预生成的客户端ID数量
 
 # ==============================================
 # 核心存储结构（对应JS的Map）
 # ==============================================
-# 客户端连接映射：client_id -> WebSocket对象
-client_connections: Dict[str, websockets.WebSocketServerProtocol] = {}
-# 绑定关系映射：client_id -> target_id（一对一）
+# 以下状态均只存在于本进程内：绑定双方可能是任意两个连接，
+# 因此服务保持单进程运行（多进程共享端口会把同一对连接分到不同进程）
+# 客户端连接映射：client_id -> 客户端封装对象
+client_connections: Dict[str, "Client"] = {}
+# 绑定关系映射：client_id -> target_id（一对一，双向存储，只通过bind_pair/unbind修改）
 binding_relations: Dict[str, str] = {}
-# 波形计时器映射：{client_id}-{channel} -> 计时器任务
-client_timers: Dict[str, asyncio.Task] = {}
+# 波形计时器映射：(client_id, channel) -> 计时器任务
+client_timers: Dict[Tuple[str, str], asyncio.Task] = {}
+# 计时器索引：client_id -> 该客户端有计时器的通道集合（断开时无需扫描全部计时器）
+timers_by_client: Dict[str, Set[str]] = {}
+# 预生成的客户端ID
+client_id_pool: List[str] = []
 
 
 def log(message: str):
@@ -29,32 +44,122 @@ def log(message: str):
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
 
 
+def new_client_id() -> str:
+    """生成UUID4格式的客户端ID（与APP协议一致），批量读取随机字节以减少系统调用"""
+    if not client_id_pool:
+        buf = os.urandom(16 * CLIENT_ID_BATCH).hex()
+        for i in range(0, len(buf), 32):
+            h = buf[i:i + 32]
+            # 按UUID4格式设置版本号(4)和变体位(10xx)
+            client_id_pool.append(
+                f"{h[:8]}-{h[8:12]}-4{h[13:16]}-{'89ab'[int(h[16], 16) & 3]}{h[17:20]}-{h[20:]}"
+            )
+    return client_id_pool.pop()
+
+
+def dumps(data) -> str:
+    """序列化消息（orjson输出bytes，解码为str以保持文本帧发送）"""
+    return orjson.dumps(data).decode()
+
+
+class Client:
+    """客户端连接封装：WebSocket对象 + 发送队列 + 写任务
+
+    所有发送方只把消息放入队列，由唯一的写任务负责写入WebSocket，
+    避免多个协程同时写同一连接。
+    """
+
+    def __init__(self, ws: websockets.WebSocketServerProtocol, client_id: str):
+        self.ws = ws
+        self.client_id = client_id
+        self.out_queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.closing = False  # 已请求关闭，不再接收新消息
+        self.last_sent = asyncio.get_running_loop().time()  # 最近一次发送时间（事件循环时钟）
+        self.writer_task = asyncio.create_task(client_writer(self))
+
+    def enqueue(self, message: Optional[str]):
+        """放入待发送消息（不等待网络写入），None表示发送完队列后关闭连接
+
+        连接已关闭或正在关闭时直接忽略。
+        队列已满（对方接收过慢）时关闭该连接而不是丢弃消息，避免bind/break等协议消息
+        被静默丢弃；连接关闭后由handle_client清理并通知对方。
+        """
+        if self.closing or self.writer_task.done():
+            return
+        try:
+            self.out_queue.put_nowait(message)
+        except asyncio.QueueFull:
+            log(f"发送队列已满，关闭连接：{self.client_id}")
+            self.closing = True
+            self.writer_task.cancel()
+            self.writer_task = asyncio.create_task(self.ws.close())
+
+    async def close(self):
+        """发送完队列中剩余消息后关闭连接"""
+        self.enqueue(None)
+        self.closing = True
+        await self.writer_task
+
+
+async def client_writer(client: Client):
+    """写任务：按顺序取出队列中的消息并发送"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            message = await client.out_queue.get()
+            if message is None:  # 关闭请求
+                await client.ws.close()
+                break
+            await client.ws.send(message)
+            client.last_sent = loop.time()
+    except websockets.exceptions.ConnectionClosed:
+        pass  # 连接已关闭，丢弃剩余消息，由handle_client负责清理
+    except Exception as e:
+        log(f"发送任务错误：{str(e)}")
+
+
 async def send_heartbeat():
-    """心跳机制：定期向所有客户端发送心跳包"""
-    heartbeat_msg = {
-        "type": "heartbeat",
-        "clientId": "",
-        "targetId": "",
-        "message": "200"
-    }
+    """心跳机制：只向空闲超过HEARTBEAT_INTERVAL的客户端发送心跳包"""
+    loop = asyncio.get_running_loop()
     while True:
-        if client_connections:  # 有连接时才发送
-            log(f"发送心跳包（当前连接数：{len(client_connections)}）")
-            for client_id, ws in client_connections.items():
-                if ws.open:  # 连接有效
-                    heartbeat_msg["clientId"] = client_id
-                    heartbeat_msg["targetId"] = binding_relations.get(client_id, "")
-                    await ws.send(json.dumps(heartbeat_msg))
-        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        now = loop.time()
+        sent = 0
+        for client_id, client in client_connections.items():
+            if now - client.last_sent >= HEARTBEAT_INTERVAL:  # 空闲已满一个心跳间隔
+                client.enqueue(dumps({
+                    "type": "heartbeat",
+                    "clientId": client_id,
+                    "targetId": binding_relations.get(client_id, ""),
+                    "message": "200"
+                }))
+                sent += 1
+        if sent:
+            log(f"发送心跳包（{sent}/{len(client_connections)}）")
+        # 按1/4间隔检查，空闲连接的心跳间隔不超过1.25倍HEARTBEAT_INTERVAL
+        await asyncio.sleep(HEARTBEAT_INTERVAL / 4)
+
+
+def bind_pair(client_id: str, target_id: str):
+    """建立双向绑定（同时写入两个方向）"""
+    binding_relations[client_id] = target_id
+    binding_relations[target_id] = client_id
+
+
+def unbind(client_id: str) -> Optional[str]:
+    """解除client_id所在的双向绑定，返回对方ID（未绑定时返回None）"""
+    target_id = binding_relations.pop(client_id, None)
+    if target_id is not None and binding_relations.get(target_id) == client_id:
+        del binding_relations[target_id]
+    return target_id
 
 
-def validate_relation(client_id: str, target_id: str, ws: websockets.WebSocketServerProtocol) -> Tuple[bool, str]:
+def validate_relation(client_id: str, target_id: str, client: Client) -> Tuple[bool, str]:
     """验证绑定关系合法性（对应JS的invalidRelation）"""
     # 检查客户端是否存在
     if client_id not in client_connections or target_id not in client_connections:
         return False, "404"  # 目标不存在
     # 检查连接是否匹配
-    if client_connections[client_id] != ws and client_connections[target_id] != ws:
+    if client_connections[client_id] is not client and client_connections[target_id] is not client:
         return False, "404"  # 非法连接
     # 检查绑定关系
     if binding_relations.get(client_id) != target_id:
@@ -62,59 +167,91 @@ def validate_relation(client_id: str, target_id: str, ws: websockets.WebSocketSe
     return True, "200"
 
 
+def unregister_timer(client_id: str, channel: str) -> Optional[asyncio.Task]:
+    """从计时器映射和索引中同时移除指定计时器，返回对应任务"""
+    task = client_timers.pop((client_id, channel), None)
+    channels = timers_by_client.get(client_id)
+    if channels is not None:
+        channels.discard(channel)
+        if not channels:
+            del timers_by_client[client_id]
+    return task
+
+
 async def cancel_timer(client_id: str, channel: str):
     """取消指定客户端+通道的波形计时器（对应JS的clearInterval）"""
-    timer_key = f"{client_id}-{channel}"
-    if timer_key in client_timers:
-        task = client_timers[timer_key]
+    task = unregister_timer(client_id, channel)
+    if task is not None:
         if not task.done():
             task.cancel()  # 取消任务
-        del client_timers[timer_key]
-        log(f"已取消计时器：{timer_key}")
+        log(f"已取消计时器：{client_id}-{channel}")
+
+
+async def start_timer(
+    client_id: str,
+    target: "Client",
+    send_data: dict,
+    total_sends: int,
+    time_space: float,
+    channel: str
+) -> asyncio.Task:
+    """启动波形计时器（同一客户端+通道已有计时器时先取消），并登记到计时器索引"""
+    await cancel_timer(client_id, channel)
+    task = asyncio.create_task(
+        delay_send_msg(client_id, target, send_data, total_sends, time_space, channel)
+    )
+    client_timers[(client_id, channel)] = task
+    timers_by_client.setdefault(client_id, set()).add(channel)
+    return task
 
 
 async def delay_send_msg(
     client_id: str,
-    target_ws: websockets.WebSocketServerProtocol,
+    target: Client,
     send_data: dict,
     total_sends: int,
     time_space: float,
     channel: str
 ):
     """波形消息定时发送（对应JS的delaySendMsg）"""
-    timer_key = f"{client_id}-{channel}"
+    timer_key = (client_id, channel)
     try:
-        # 立即发送第一次
-        if target_ws.open:
-            await target_ws.send(json.dumps(send_data))
+        # 立即发送第一次（每次内容相同，只序列化一次）
+        payload = dumps(send_data)
+        target.enqueue(payload)
         total_sends -= 1
         log(f"发送波形消息（剩余：{total_sends}）：{send_data['message']}")
 
-        # 循环发送剩余消息
+        # 循环发送剩余消息（按固定截止时间调度，发送耗时不会累积成漂移）
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
         while total_sends > 0:
-            await asyncio.sleep(time_space)  # 间隔发送
-            if not target_ws.open:  # 目标连接已关闭
+            next_time += time_space
+            await asyncio.sleep(max(0, next_time - loop.time()))  # 间隔发送
+            if target.writer_task.done():  # 写任务已结束，目标连接已关闭
                 log("目标连接已关闭，停止发送波形")
                 break
-            await target_ws.send(json.dumps(send_data))
+            target.enqueue(payload)
             total_sends -= 1
             log(f"发送波形消息（剩余：{total_sends}）：{send_data['message']}")
 
         # 发送完毕
-        log(f"波形消息发送完成（{timer_key}）")
+        log(f"波形消息发送完成（{client_id}-{channel}）")
     finally:
-        if timer_key in client_timers:
-            del client_timers[timer_key]
+        # 只移除自己的记录（被start_timer替换时，新计时器已占用同一键）
+        if client_timers.get(timer_key) is asyncio.current_task():
+            unregister_timer(client_id, channel)
 
 
 async def handle_client(ws: websockets.WebSocketServerProtocol):
     """处理客户端连接（对应JS的wss.on('connection')）"""
-    client_id = str(uuid.uuid4())  # 生成唯一ID
+    client_id = new_client_id()  # 生成唯一ID
     log(f"新连接建立，clientId：{client_id}")
-    client_connections[client_id] = ws
+    client = Client(ws, client_id)
+    client_connections[client_id] = client
 
     # 发送绑定ID给客户端（对应JS的ws.send(bind消息)）
-    await ws.send(json.dumps({
+    client.enqueue(dumps({
         "type": "bind",
         "clientId": client_id,
         "targetId": "",
@@ -124,13 +261,12 @@ async def handle_client(ws: websockets.WebSocketServerProtocol):
     try:
         async for message in ws:
             try:
-                data = json.loads(message)
+                data = orjson.loads(message)
                 log(f"收到消息：{data}（来自 {client_id}）")
 
-                # 验证必填字段
-                required = ["type", "clientId", "targetId", "message"]
-                if not all(k in data for k in required):
-                    await ws.send(json.dumps({
+                # 验证必填字段（非JSON对象同样视为缺少字段）
+                if not isinstance(data, dict) or not REQUIRED_FIELDS.issubset(data):
+                    client.enqueue(dumps({
                         "type": "error",
                         "clientId": "",
                         "targetId": "",
@@ -147,7 +283,7 @@ async def handle_client(ws: websockets.WebSocketServerProtocol):
                 if type_ == "bind":
                     # 检查目标客户端是否存在
                     if target_id not in client_connections:
-                        await ws.send(json.dumps({
+                        client.enqueue(dumps({
                             "type": "bind",
                             "clientId": client_id,
                             "targetId": target_id,
@@ -155,10 +291,9 @@ async def handle_client(ws: websockets.WebSocketServerProtocol):
                         }))
                         continue
 
-                    # 检查是否已绑定（防止重复绑定）
-                    if (client_id in binding_relations or 
-                        target_id in binding_relations.values()):
-                        await ws.send(json.dumps({
+                    # 检查是否已绑定（防止重复绑定，绑定关系双向存储，直接查键即可）
+                    if client_id in binding_relations or target_id in binding_relations:
+                        client.enqueue(dumps({
                             "type": "bind",
                             "clientId": client_id,
                             "targetId": target_id,
@@ -167,24 +302,23 @@ async def handle_client(ws: websockets.WebSocketServerProtocol):
                         continue
 
                     # 建立双向绑定
-                    binding_relations[client_id] = target_id
-                    binding_relations[target_id] = client_id  # 反向绑定
-                    # 通知双方绑定成功
-                    bind_success = {
+                    bind_pair(client_id, target_id)
+                    # 通知双方绑定成功（双方消息相同，只序列化一次）
+                    bind_success = dumps({
                         "type": "bind",
                         "clientId": client_id,
                         "targetId": target_id,
                         "message": "200"
-                    }
-                    await client_connections[client_id].send(json.dumps(bind_success))
-                    await client_connections[target_id].send(json.dumps(bind_success))
+                    })
+                    client_connections[client_id].enqueue(bind_success)
+                    client_connections[target_id].enqueue(bind_success)
                     log(f"绑定成功：{client_id} <-> {target_id}")
                     continue
 
                 # 验证绑定关系（非bind消息需要验证）
-                valid, err_code = validate_relation(client_id, target_id, ws)
+                valid, err_code = validate_relation(client_id, target_id, client)
                 if not valid:
-                    await ws.send(json.dumps({
+                    client.enqueue(dumps({
                         "type": "error",
                         "clientId": client_id,
                         "targetId": target_id,
@@ -193,18 +327,33 @@ async def handle_client(ws: websockets.WebSocketServerProtocol):
                     continue
 
                 # 处理其他消息（默认情况）
-                target_ws = client_connections[target_id]
-                await target_ws.send(json.dumps({
-                    "type": type_,
-                    "clientId": client_id,
-                    "targetId": target_id,
-                    "message": message
-                }))
+                if isinstance(message, list):
+                    # 仅msg类型的非空字符串指令列表会逐条拆分转发（APP端每帧只接受一条指令）
+                    if (type_ != "msg" or not message
+                            or not all(isinstance(item, str) for item in message)):
+                        client.enqueue(dumps({
+                            "type": "error",
+                            "clientId": "",
+                            "targetId": "",
+                            "message": "403"  # 非法的指令列表
+                        }))
+                        continue
+                    items = message
+                else:
+                    items = (message,)
+                target = client_connections[target_id]
+                for item in items:
+                    target.enqueue(dumps({
+                        "type": type_,
+                        "clientId": client_id,
+                        "targetId": target_id,
+                        "message": item
+                    }))
                 log(f"转发消息：{type_} -> {target_id}")
 
-            except json.JSONDecodeError:
+            except orjson.JSONDecodeError:
                 # 非JSON格式消息
-                await ws.send(json.dumps({
+                client.enqueue(dumps({
                     "type": "error",
                     "clientId": "",
                     "targetId": "",
@@ -213,7 +362,7 @@ async def handle_client(ws: websockets.WebSocketServerProtocol):
                 log("收到非JSON格式消息")
             except Exception as e:
                 log(f"消息处理错误：{str(e)}")
-                await ws.send(json.dumps({
+                client.enqueue(dumps({
                     "type": "error",
                     "clientId": data.get("clientId", ""),
                     "targetId": data.get("targetId", ""),
@@ -224,49 +373,65 @@ async def handle_client(ws: websockets.WebSocketServerProtocol):
         log(f"连接关闭：{client_id}")
     finally:
         # 清理资源（对应JS的ws.on('close')）
-        # 1. 移除客户端连接
+        # 1. 移除客户端连接，停止写任务
         if client_id in client_connections:
             del client_connections[client_id]
+        client.writer_task.cancel()
         
         # 2. 处理绑定关系，通知对方
-        if client_id in binding_relations:
-            target_id = binding_relations[client_id]
-            # 通知对方连接断开
-            if target_id in client_connections and client_connections[target_id].open:
-                await client_connections[target_id].send(json.dumps({
+        # 先清除绑定关系（等待关闭对方连接期间，对方的清理流程可能同时执行）
+        cleanups = []
+        target_id = unbind(client_id)
+        if target_id is not None:
+            log(f"解除绑定：{client_id} <-> {target_id}")
+            # 通知对方连接断开（不预先检查连接状态，对方已断开时由写任务处理ConnectionClosed）
+            target = client_connections.get(target_id)
+            if target is not None:
+                target.enqueue(dumps({
                     "type": "break",
                     "clientId": client_id,
                     "targetId": target_id,
                     "message": "209"  # 对方断开
                 }))
-                await client_connections[target_id].close()  # 关闭对方连接
-            # 清除绑定关系
-            del binding_relations[client_id]
-            if target_id in binding_relations:
-                del binding_relations[target_id]
-            log(f"解除绑定：{client_id} <-> {target_id}")
-        
-        # 3. 取消相关计时器
-        for key in list(client_timers.keys()):
-            if key.startswith(f"{client_id}-"):
-                await cancel_timer(client_id, key.split("-")[1])
-        
+                cleanups.append(target.close())  # 发送完毕后关闭对方连接
+
+        # 3. 取消相关计时器（只遍历该客户端自己的通道）
+        for channel in timers_by_client.pop(client_id, ()):
+            cleanups.append(cancel_timer(client_id, channel))
+
+        # 关闭对方连接与取消计时器互不依赖，并发执行
+        results = await asyncio.gather(*cleanups, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                log(f"资源清理错误（{client_id}）：{str(result)}")
+
         log(f"资源清理完成（{client_id}），当前连接数：{len(client_connections)}")
 
 
 async def main():
     """启动服务（主入口）"""
-    # 启动心跳任务
-    asyncio.create_task(send_heartbeat())
-    # 启动WebSocket服务
-    async with websockets.serve(handle_client, "0.0.0.0", WS_SERVER_PORT):
+    # 启动WebSocket服务（消息都很短，关闭permessage-deflate压缩；保留内置ping用于发现断线的对端）
+    async with websockets.serve(
+        handle_client, "0.0.0.0", WS_SERVER_PORT,
+        compression=None, max_size=WS_MAX_SIZE
+    ):
         log(f"WebSocket服务启动，端口：{WS_SERVER_PORT}")
-        await asyncio.Future()  # 保持服务运行
+        # 启动心跳任务（保存引用，退出时取消）
+        heartbeat_task = asyncio.create_task(send_heartbeat())
+        try:
+            await asyncio.Future()  # 保持服务运行
+        finally:
+            heartbeat_task.cancel()
+            await asyncio.gather(heartbeat_task, return_exceptions=True)
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        # uvloop.run()从0.18开始提供，旧版本回退到标准事件循环
+        if uvloop is not None and hasattr(uvloop, "run"):
+            uvloop.run(main())  # 不使用已弃用的uvloop.install()/事件循环策略
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         log("服务已手动停止")
     except Exception as e:
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=['websockets', 'uuid'],
+    hiddenimports=['websockets', 'orjson'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
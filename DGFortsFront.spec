@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=['websockets', 'qrcode', 'tailer'],
+    hiddenimports=['websockets', 'qrcode', 'aiofiles', 'orjson'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
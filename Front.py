@@ -1,8 +1,12 @@
 import asyncio
+import codecs
 import json
 import os
-from tailer import follow
+from dataclasses import dataclass, fields
 from datetime import datetime
+from typing import List, Union
+import aiofiles
+import orjson
 import qrcode
 import websockets
 
@@ -11,41 +15,66 @@ FrontClientId = ""
 TargetAPPId = ""
 ws_conn = None
 
+# 其他配置
+WS_SERVER_PORT = 8765
+DATA_PREFIX = "[DGFortsRemoteData]"
+CONFIG_FILE = os.environ.get("DGFORTS_CONFIG", "config.json")  # 配置文件路径
+
+
+def log(message: str):
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+
+
 # ==============================================
-# 用户输入配置（新增部分）
+# 配置文件读取
 # ==============================================
-def get_user_config():
-    """获取用户输入的服务器IP和二维码保存路径"""
-    # 提示用户输入，支持默认值
-    default_ip = "192.168.137.1"
-    default_qr_path = "../../../DGForts_qrcode.png"
-    default_logfile_path = "D:/ROBERT/Steam/steamapps/common/Forts/users/76561198359266518/log.txt"
-    print(f"\n请配置服务器信息（直接回车使用默认值）")
-    server_ip = input(f"服务器IP（默认：{default_ip}）：").strip()
-    qr_path = input(f"二维码保存路径（默认：{default_qr_path}）：").strip()
-    logfile_path = input(f"Forts日志文件路径（默认：{default_logfile_path}）：").strip()
-    # 处理默认值
-    server_ip = server_ip if server_ip else default_ip
-    qr_path = qr_path if qr_path else default_qr_path
-    logfile_path = logfile_path if logfile_path else default_logfile_path
+@dataclass
+class AppConfig:
+    """服务器IP、二维码保存路径、Forts日志文件路径"""
+    server_ip: str = "192.168.137.1"
+    qr_path: str = "../../../DGForts_qrcode.png"
+    logfile_path: str = "D:/ROBERT/Steam/steamapps/common/Forts/users/76561198359266518/log.txt"
+
+
+def load_config(path: str = CONFIG_FILE) -> AppConfig:
+    """读取JSON配置文件，缺失的配置项使用默认值"""
+    loaded = AppConfig()
+    try:
+        with open(path, "rb") as f:
+            data = orjson.loads(f.read())
+    except FileNotFoundError:
+        log(f"未找到配置文件：{path}，使用默认配置")
+        data = {}
+    except OSError as e:
+        log(f"无法读取配置文件，使用默认配置：{str(e)}")
+        data = {}
+    except orjson.JSONDecodeError as e:
+        log(f"配置文件格式错误，使用默认配置：{str(e)}")
+        data = {}
+    else:
+        if isinstance(data, dict):
+            log(f"已读取配置文件：{path}")
+        else:
+            log(f"配置文件内容不是JSON对象，使用默认配置：{path}")
+            data = {}
+    for field in fields(AppConfig):
+        if field.name not in data:
+            continue
+        value = data[field.name]
+        if isinstance(value, str) and value.strip():
+            setattr(loaded, field.name, value.strip())
+        else:
+            log(f"配置项 {field.name} 不是非空字符串，已忽略并使用默认值：{getattr(loaded, field.name)}")
     # 确保二维码保存目录存在
-    qr_dir = os.path.dirname(qr_path)
+    qr_dir = os.path.dirname(loaded.qr_path)
     if qr_dir and not os.path.exists(qr_dir):
         os.makedirs(qr_dir, exist_ok=True)
-        print(f"已自动创建二维码保存目录：{qr_dir}")
-    
-    return server_ip, qr_path , logfile_path
+        log(f"已自动创建二维码保存目录：{qr_dir}")
+    return loaded
 
-# 获取用户配置
-SERVER_IP, QR_CODE_PATH ,LOG_FILE_PATH= get_user_config()
 
-# 其他配置
-WS_SERVER_PORT = 8765
-DATA_PREFIX = "[DGFortsRemoteData]"
-WS_URL = f"ws://{SERVER_IP}:{WS_SERVER_PORT}/ws"  # 使用用户输入的IP
-
-def log(message: str):
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+# 当前配置（main启动时从配置文件加载）
+config = AppConfig()
 
 
 def generate_qrcode(content: str, save_path: str):
@@ -74,9 +103,9 @@ async def websocket_message_handler(websocket):
                 if not data.get("targetId") and data.get("clientId"):
                     FrontClientId = data["clientId"]
                     log(f"已获取前端ID：{FrontClientId}")
-                    # 二维码内容使用用户输入的IP
-                    qr_content = f"https://www.dungeon-lab.com/app-download.php#DGLAB-SOCKET#ws://{SERVER_IP}:{WS_SERVER_PORT}/{FrontClientId}"
-                    generate_qrcode(qr_content, QR_CODE_PATH)
+                    # 二维码内容使用配置文件中的服务器IP
+                    qr_content = f"https://www.dungeon-lab.com/app-download.php#DGLAB-SOCKET#ws://{config.server_ip}:{WS_SERVER_PORT}/{FrontClientId}"
+                    generate_qrcode(qr_content, config.qr_path)
                 elif data.get("targetId") and data.get("clientId") == FrontClientId:
                     TargetAPPId = data["targetId"]
                     log(f"已绑定APP ID：{TargetAPPId}")
@@ -91,6 +120,7 @@ async def websocket_message_handler(websocket):
 async def connect_websocket():
     global ws_conn
     log("=== 开始执行WebSocket连接流程 ===")
+    ws_url = f"ws://{config.server_ip}:{WS_SERVER_PORT}/ws"
 
     while True:
         try:
@@ -98,9 +128,9 @@ async def connect_websocket():
                 log("WebSocket已连接，无需重复连接")
                 return
 
-            log(f"尝试连接：{WS_URL}（超时10秒）")
+            log(f"尝试连接：{ws_url}（超时10秒）")
             ws_conn = await asyncio.wait_for(
-                websockets.connect(WS_URL),
+                websockets.connect(ws_url),
                 timeout=10
             )
             log(f"✅ 连接成功！")
@@ -114,7 +144,8 @@ async def connect_websocket():
         await asyncio.sleep(5)
 
 
-async def send_command_to_app(command: str):
+async def send_command_to_app(command: Union[str, List[str]]):
+    """发送指令给APP，传入列表时合并为一条WebSocket消息（由后端拆分转发）"""
     global FrontClientId, TargetAPPId, ws_conn
     if not TargetAPPId or not FrontClientId or not ws_conn or ws_conn.closed:
         log(f"无法发送指令：未绑定或连接断开")
@@ -135,47 +166,51 @@ async def send_command_to_app(command: str):
         return False
 
 
-async def monitor_game_log():
-    log("=== 开始监控游戏日志 ===")
-    loop = asyncio.get_running_loop()
-    f = None
+async def handle_log_line(line: str):
+    if line.startswith(DATA_PREFIX):
+        game_data = line[len(DATA_PREFIX):].strip()
+        log(f"提取到游戏数据：{game_data}")
 
-    try:
-        f = open(LOG_FILE_PATH, "r", encoding="utf-16", errors="ignore")
-        log_follower = follow(f)
-
-        while True:
-            line = await loop.run_in_executor(None, next, log_follower)
-
-            if line.startswith(DATA_PREFIX):
-                game_data = line[len(DATA_PREFIX):].strip()
-                log(f"提取到游戏数据：{game_data}")
-
-                if game_data == "StartConnectWebSocketServer":
-                    if not ws_conn or ws_conn.closed:
-                        log("收到启动指令，创建WebSocket任务...")
-                        asyncio.create_task(connect_websocket())
-                    else:
-                        log("WebSocket已连接")
-                elif TargetAPPId and FrontClientId and ws_conn and not ws_conn.closed:
-                    if game_data.startswith("StrengthSet:"):
-                        strength = game_data[len("StrengthSet:"):].strip()
-                        await send_command_to_app(f'strength-1+2+{strength}')
-                        await send_command_to_app(f'strength-2+2+{strength}')
-    except StopIteration:
-        log("日志迭代结束")
-    except FileNotFoundError:
-        log(f"日志文件不存在：{LOG_FILE_PATH}")
-    except Exception as e:
-        log(f"日志监控错误：{str(e)}")
-    finally:
-        if f:
-            f.close()
+        if game_data == "StartConnectWebSocketServer":
+            if not ws_conn or ws_conn.closed:
+                log("收到启动指令，创建WebSocket任务...")
+                asyncio.create_task(connect_websocket())
+            else:
+                log("WebSocket已连接")
+        elif TargetAPPId and FrontClientId and ws_conn and not ws_conn.closed:
+            if game_data.startswith("StrengthSet:"):
+                strength = game_data[len("StrengthSet:"):].strip()
+                await send_command_to_app([f'strength-1+2+{strength}', f'strength-2+2+{strength}'])
+
+
+async def monitor_game_log():
+    while True:
+        log("=== 开始监控游戏日志 ===")
+        try:
+            async with aiofiles.open(config.logfile_path, "rb") as f:
+                await f.seek(0, 2)  # 从文件末尾开始，只处理新写入的日志
+                # 从文件中间开始读取时没有BOM，按UTF-16LE增量解码（可处理被截断的字符）
+                decoder = codecs.getincrementaldecoder("utf-16-le")(errors="ignore")
+                pending = ""  # 尚未写完整的最后一行
+                while True:
+                    # 一次读取全部新增内容，而不是每行一次线程切换
+                    chunk = decoder.decode(await f.read())
+                    if not chunk:
+                        await asyncio.sleep(0.1)
+                        continue
+                    *lines, pending = (pending + chunk).split("\n")
+                    for line in lines:
+                        await handle_log_line(line.rstrip("\r"))
+        except FileNotFoundError:
+            log(f"日志文件不存在：{config.logfile_path}")
+        except Exception as e:
+            log(f"日志监控错误：{str(e)}")
         await asyncio.sleep(10)
-        await monitor_game_log()
 
 
 async def main():
+    global config
+    config = load_config()
     await monitor_game_log()
 
 
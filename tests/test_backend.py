@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+import sys
+import unittest
+
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Backend  # noqa: E402
+
+
+class TimerCleanupTest(unittest.IsolatedAsyncioTestCase):
+    """波形计时器的登记与断开连接时的清理"""
+
+    async def asyncSetUp(self):
+        Backend.client_connections.clear()
+        Backend.binding_relations.clear()
+        Backend.client_timers.clear()
+        Backend.timers_by_client.clear()
+        self.server = await websockets.serve(Backend.handle_client, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def connect(self):
+        """连接服务并返回 (WebSocket, 服务端分配的clientId)"""
+        ws = await websockets.connect(f"ws://127.0.0.1:{self.port}")
+        client_id = json.loads(await ws.recv())["clientId"]
+        return ws, client_id
+
+    async def wait_until(self, condition, timeout=2.0):
+        """轮询等待服务端完成清理"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not condition():
+            if loop.time() > deadline:
+                self.fail("等待超时")
+            await asyncio.sleep(0.01)
+
+    def pulse(self, client_id):
+        return {"type": "msg", "clientId": client_id, "targetId": "", "message": "pulse-A"}
+
+    async def test_timer_cancelled_on_disconnect(self):
+        ws, client_id = await self.connect()
+        client = Backend.client_connections[client_id]
+        task = await Backend.start_timer(client_id, client, self.pulse(client_id), 100, 0.05, "A1")
+        self.assertIs(Backend.client_timers[(client_id, "A1")], task)
+        self.assertEqual(Backend.timers_by_client, {client_id: {"A1"}})
+
+        await ws.close()
+        await self.wait_until(lambda: client_id not in Backend.client_connections)
+        await self.wait_until(task.done)
+
+        self.assertTrue(task.cancelled())
+        self.assertEqual(Backend.client_timers, {})
+        self.assertEqual(Backend.timers_by_client, {})
+
+    async def test_finished_timer_unregistered(self):
+        ws, client_id = await self.connect()
+        client = Backend.client_connections[client_id]
+        task = await Backend.start_timer(client_id, client, self.pulse(client_id), 2, 0.01, "B")
+        await task
+
+        self.assertEqual(Backend.client_timers, {})
+        self.assertEqual(Backend.timers_by_client, {})
+        await ws.close()
+
+    async def test_replaced_timer_stays_registered(self):
+        ws, client_id = await self.connect()
+        client = Backend.client_connections[client_id]
+        old = await Backend.start_timer(client_id, client, self.pulse(client_id), 100, 0.05, "A1")
+        new = await Backend.start_timer(client_id, client, self.pulse(client_id), 100, 0.05, "A1")
+        await self.wait_until(old.done)
+
+        self.assertTrue(old.cancelled())
+        self.assertIs(Backend.client_timers[(client_id, "A1")], new)
+        self.assertEqual(Backend.timers_by_client, {client_id: {"A1"}})
+
+        await ws.close()
+        await self.wait_until(new.done)
+        self.assertEqual(Backend.client_timers, {})
+
+
+class BlockingWebSocket:
+    """send()一直阻塞的假连接，用于模拟接收过慢的对端"""
+
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+        self.unblock = asyncio.Event()
+
+    async def send(self, message):
+        await self.unblock.wait()
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+class SendQueueTest(unittest.IsolatedAsyncioTestCase):
+    """每个连接的发送队列"""
+
+    async def test_overflow_closes_connection(self):
+        ws = BlockingWebSocket()
+        client = Backend.Client(ws, "slow-client")
+        client.enqueue("first")
+        await asyncio.sleep(0)  # 写任务取出第一条后阻塞在send
+        for i in range(Backend.SEND_QUEUE_SIZE + 1):
+            client.enqueue(f"msg-{i}")
+        await client.writer_task
+
+        self.assertTrue(ws.closed)
+        self.assertTrue(client.closing)
+        client.enqueue("late")  # 关闭后不再入队
+        self.assertEqual(client.out_queue.qsize(), Backend.SEND_QUEUE_SIZE)
+
+    async def test_enqueue_ignored_after_writer_finished(self):
+        ws = BlockingWebSocket()
+        ws.unblock.set()
+        client = Backend.Client(ws, "closed-client")
+        await client.close()
+
+        self.assertTrue(client.writer_task.done())
+        client.enqueue("heartbeat")
+        self.assertEqual(client.out_queue.qsize(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()